@@ -1,13 +1,33 @@
-import pandas as pd
 import numpy as np
-import joblib
 import serial
 import time
 import sys
 import os
 import json
-from scipy.spatial.distance import euclidean
-from sklearn.preprocessing import StandardScaler
+import importlib.util
+from numpy.lib.stride_tricks import sliding_window_view
+# pandas, joblib y scipy se importan dentro de las funciones que los usan (entrenamiento,
+# .pkl antiguos, DTW sin Numba): el detector y la grabación arrancan sin cargarlos
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    # Sin Numba se usa la ruta NumPy/SciPy (más lenta pero equivalente)
+    NUMBA_AVAILABLE = False
+    prange = range
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+try:
+    # Extensión C opcional para equipos sin Numba (ver dtw_native.pyx)
+    if __package__:
+        from . import dtw_native
+    else:
+        import dtw_native
+    NATIVE_AVAILABLE = True
+except ImportError:
+    NATIVE_AVAILABLE = False
 
 # --- CONFIGURACIÓN GLOBAL ---
 # Usamos rutas absolutas para que funcione bien tanto desde terminal como desde Flask
@@ -26,63 +46,322 @@ DTW_THRESHOLD = 190.0       # Umbral de similitud (menor es más estricto)
 MIN_ACTIVITY = 0.08         # Filtro de ruido/reposo
 COOLDOWN_SAMPLES = 40       # Tiempo de espera tras detección
 SIMILARITY_MARGIN = 30.0    # Margen para diferenciar entre gestos similares
+DTW_BAND = 10               # Banda Sakoe-Chiba (desfase máximo permitido en DTW)
 
-realtime_buffer = []
+# Buffer circular preasignado: la muestra k se guarda en la fila k % DETECTION_WINDOW,
+# ya con sus 8 características (6 canales + magnitudes de giroscopio y acelerómetro)
+realtime_buffer = np.empty((DETECTION_WINDOW, NUM_SENSOR_VALUES + 2), dtype=np.float32)
+buffer_count = 0
 cooldown_counter = 0
+# Suma y suma de cuadrados (float64) por canal de las últimas muestras de la ventana
+window_moments = np.zeros((2, NUM_SENSOR_VALUES))
 
 if not os.path.exists(MODELS_DIR):
     os.makedirs(MODELS_DIR)
 
 # --- FUNCIONES DE MATEMÁTICAS Y PROCESAMIENTO ---
 
-def normalize_sequence(sequence):
-    """Normaliza los datos para que la escala no afecte la comparación."""
-    scaler = StandardScaler()
-    return scaler.fit_transform(sequence)
+# fastmath para los núcleos DTW sin 'nnan'/'ninf': los centinelas, el abandono temprano
+# y el bsf por defecto usan inf, y sus comparaciones deben seguir bien definidas
+DTW_FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+def normalize_sequence(sequence, out=None):
+    """Normaliza los datos para que la escala no afecte la comparación.
+
+    Con `out` (float32, misma forma, sin solaparse con `sequence`) no se reserva memoria
+    del tamaño de la ventana.
+    """
+    seq = np.asarray(sequence, dtype=np.float32)
+    mu = seq.mean(axis=0)
+    out = np.subtract(seq, mu, out=out)
+    sd = np.sqrt(np.einsum('ij,ij->j', out, out) / len(seq))
+    sd[sd < 1e-8] = 1.0  # Columnas constantes: igual que StandardScaler
+    out /= sd
+    return out
+
+@njit(cache=True, fastmath=DTW_FASTMATH)
+def _dtw_nb(a, b, w, bsf):
+    """Núcleo DTW compilado: costo euclidiano por celda calculado en línea.
+
+    Abandona (devuelve inf) en cuanto una fila completa supera `bsf`.
+    Solo guarda dos filas de la matriz acumulada (la anterior y la actual).
+    """
+    n, m = a.shape[0], b.shape[0]
+    dims = a.shape[1]
+    w = max(w, abs(n - m))  # La banda debe alcanzar la esquina (n, m)
+    prev = np.full(m + 1, np.inf, dtype=np.float32)
+    curr = np.full(m + 1, np.inf, dtype=np.float32)
+    prev[0] = 0.0
+
+    for i in range(1, n + 1):
+        lo = max(1, i - w)
+        curr[lo - 1] = np.inf  # Borde izquierdo de la banda (resto de la fila ya es válido)
+        row_min = np.inf
+        for j in range(lo, min(m, i + w) + 1):
+            c = 0.0
+            for k in range(dims):
+                d = a[i-1, k] - b[j-1, k]
+                c += d * d
+            curr[j] = np.sqrt(c) + min(prev[j], curr[j-1], prev[j-1])
+            row_min = min(row_min, curr[j])
+        if row_min > bsf:
+            return np.inf
+        prev, curr = curr, prev
+    return prev[m]
+
+# Plantilla de código para un núcleo con longitud, banda y dimensión fijas: los límites
+# quedan como constantes y la suma por columnas se escribe desenrollada
+_DTW_FIXED_SRC = '''# Generado por Entrenamiento._make_fixed_kernel (no editar)
+import numpy as np
+
+
+def _dtw_fixed(a, b, bsf):
+    prev = np.full({n} + 1, np.inf, dtype=np.float32)
+    curr = np.full({n} + 1, np.inf, dtype=np.float32)
+    prev[0] = 0.0
+    for i in range(1, {n} + 1):
+        lo = max(1, i - {w})
+        curr[lo - 1] = np.inf
+        row_min = np.inf
+        for j in range(lo, min({n}, i + {w}) + 1):
+            c = 0.0
+{cost}
+            curr[j] = np.sqrt(c) + min(prev[j], curr[j-1], prev[j-1])
+            row_min = min(row_min, curr[j])
+        if row_min > bsf:
+            return np.inf
+        prev, curr = curr, prev
+    return prev[{n}]
+'''
+
+def _make_fixed_kernel(n, w, dims):
+    """Genera y compila un núcleo DTW especializado para secuencias n x dims con banda w.
+
+    El código se escribe como módulo en __pycache__ para que Numba guarde la compilación
+    en disco y solo el primer arranque pague el JIT.
+    """
+    # Acumulador float64 por celda, igual que `c = 0.0` en _dtw_nb
+    cost = '\n'.join(f'            c += (a[i-1, {k}] - b[j-1, {k}]) ** 2' for k in range(dims))
+    src = _DTW_FIXED_SRC.format(n=n, w=w, cost=cost)
+    name = f'_dtw_fixed_{n}x{dims}_w{w}'
+    path = os.path.join(BASE_DIR, '__pycache__', name + '.py')
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        current = None
+        if os.path.exists(path):
+            with open(path) as f:
+                current = f.read()
+        if current != src:
+            # Escritura atómica: otro proceso que arranque a la vez (app.py y Testing_Final)
+            # ve el archivo anterior o el nuevo completo, nunca uno a medio escribir
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                f.write(src)
+            os.replace(tmp, path)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module  # La caché de Numba reimporta el módulo por nombre
+        spec.loader.exec_module(module)
+        return njit(cache=True, fastmath=DTW_FASTMATH)(module._dtw_fixed)
+    except (OSError, SyntaxError):
+        # Directorio de solo lectura (o módulo ilegible): se compila en memoria en cada arranque
+        sys.modules.pop(name, None)
+        namespace = {}
+        exec(src, namespace)
+        return njit(fastmath=DTW_FASTMATH)(namespace['_dtw_fixed'])
+
+# Núcleo especializado para el caso habitual: plantillas de TEMPLATE_LENGTH x 8 y banda DTW_BAND
+FIXED_SHAPE = (TEMPLATE_LENGTH, 8)
+_dtw_fixed = _make_fixed_kernel(TEMPLATE_LENGTH, DTW_BAND, 8) if NUMBA_AVAILABLE else None
+
+def _dtw_cdist(a, b, w, bsf=np.inf):
+    """DTW sin Numba: la matriz de costos se calcula de una sola vez con cdist.
+
+    El acumulado se lleva en dos filas (anterior y actual) como listas de Python,
+    que se indexan mucho más rápido que un array de NumPy celda a celda.
+    """
+    n, m = a.shape[0], b.shape[0]
+    w = max(w, abs(n - m))
+    from scipy.spatial.distance import cdist
+    C = cdist(a, b, 'euclidean').tolist()
+    prev = [np.inf] * (m + 1)
+    curr = [np.inf] * (m + 1)
+    prev[0] = 0.0
 
-def dtw_distance(seq1, seq2):
-    """Dynamic Time Warping: Compara dos secuencias temporales."""
-    n, m = len(seq1), len(seq2)
-    dtw_matrix = np.full((n + 1, m + 1), np.inf)
-    dtw_matrix[0, 0] = 0
-    
     for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            cost = euclidean(seq1[i-1], seq2[j-1])
-            dtw_matrix[i, j] = cost + min(
-                dtw_matrix[i-1, j],
-                dtw_matrix[i, j-1],
-                dtw_matrix[i-1, j-1]
-            )
-    return dtw_matrix[n, m]
-
-def extract_temporal_features(data):
-    """Calcula magnitudes y combina con datos crudos."""
-    data_df = pd.DataFrame(data, columns=SENSOR_COLS)
-    gyro_mag = np.sqrt(data_df['Gyro_X']**2 + data_df['Gyro_Y']**2 + data_df['Gyro_Z']**2)
-    acc_mag = np.sqrt(data_df['Acc_X']**2 + data_df['Acc_Y']**2 + data_df['Acc_Z']**2)
-    temporal_features = np.column_stack([
-        data_df[SENSOR_COLS].values,
-        gyro_mag.values.reshape(-1, 1),
-        acc_mag.values.reshape(-1, 1)
-    ])
-    return temporal_features
+        lo, hi = max(1, i - w), min(m, i + w)
+        costs = C[i-1]
+        curr[lo - 1] = np.inf
+        row_min = np.inf
+        for j in range(lo, hi + 1):
+            d = costs[j-1] + min(prev[j], curr[j-1], prev[j-1])
+            curr[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > bsf:
+            return np.inf
+        prev, curr = curr, prev
+    return prev[m]
+
+def dtw_distance(seq1, seq2, w=DTW_BAND, best_so_far=np.inf):
+    """Dynamic Time Warping: Compara dos secuencias temporales dentro de una banda de ancho w.
+
+    Si la distancia no puede quedar por debajo de `best_so_far` devuelve inf (abandono temprano).
+    """
+    a = np.ascontiguousarray(seq1, dtype=np.float32)
+    b = np.ascontiguousarray(seq2, dtype=np.float32)
+    # Los núcleos toman el número de columnas de `a` y no revisan límites
+    if a.ndim != 2 or b.ndim != 2 or a.shape[1] != b.shape[1]:
+        raise ValueError(f"Secuencias incompatibles para DTW: {a.shape} vs {b.shape}")
+    if NUMBA_AVAILABLE:
+        if a.shape == FIXED_SHAPE and b.shape == FIXED_SHAPE and w == DTW_BAND:
+            return _dtw_fixed(a, b, best_so_far)
+        return _dtw_nb(a, b, w, best_so_far)
+    if NATIVE_AVAILABLE:
+        return dtw_native.dtw(a, b, w, best_so_far)
+    return _dtw_cdist(a, b, w, best_so_far)
+
+@njit(cache=True, parallel=True, fastmath=DTW_FASTMATH)
+def _dtw_batch(current, templates, bands, bsf, out):
+    """Un DTW por plantilla, repartidos entre los núcleos disponibles."""
+    fixed = (current.shape[0] == TEMPLATE_LENGTH and current.shape[1] == 8
+             and templates.shape[1] == TEMPLATE_LENGTH and templates.shape[2] == 8)
+    for t in prange(templates.shape[0]):
+        if fixed and bands[t] == DTW_BAND:
+            out[t] = _dtw_fixed(current, templates[t], bsf)
+        else:
+            out[t] = _dtw_nb(current, templates[t], bands[t], bsf)
+
+def dtw_batch(current, templates, bands, best_so_far=np.inf):
+    """Distancias DTW de `current` contra un arreglo apilado de plantillas (T x L x F)."""
+    current = np.ascontiguousarray(current, dtype=np.float32)
+    if current.ndim != 2 or templates.ndim != 3 or templates.shape[2] != current.shape[1]:
+        raise ValueError(f"Plantillas incompatibles para DTW: {current.shape} vs {templates.shape}")
+    out = np.empty(len(templates))
+    if NUMBA_AVAILABLE:
+        _dtw_batch(current, templates, bands, best_so_far, out)
+    elif NATIVE_AVAILABLE:
+        for t in range(len(templates)):
+            out[t] = dtw_native.dtw(current, templates[t], bands[t], best_so_far)
+    else:
+        for t in range(len(templates)):
+            out[t] = _dtw_cdist(current, templates[t], bands[t], best_so_far)
+    return out
+
+def ring_window(buffer, count, length):
+    """Devuelve en orden temporal las últimas `length` muestras de un buffer circular."""
+    size = len(buffer)
+    head = count % size
+    start = (head - length) % size
+    if start < head:
+        return buffer[start:head]
+    return np.concatenate((buffer[start:], buffer[:head]))
+
+@njit(cache=True)
+def push_sample(buffer, moments, count, length, vals):
+    """Escribe la muestra `count` (con sus magnitudes) en el buffer circular y actualiza
+    los momentos de los canales crudos.
+
+    La muestra que sale de la ventana de `length` se resta antes de sobrescribirla.
+    """
+    size = buffer.shape[0]
+    head = count % size
+    tail = (count - length) % size
+    for k in range(moments.shape[1]):
+        if count >= length:
+            y = np.float64(buffer[tail, k])
+            moments[0, k] -= y
+            moments[1, k] -= y * y
+        buffer[head, k] = vals[k]
+        x = np.float64(buffer[head, k])  # El valor ya redondeado a float32
+        moments[0, k] += x
+        moments[1, k] += x * x
+    # Magnitudes calculadas una sola vez por muestra (mismas operaciones que _extract_feats)
+    gx, gy, gz = buffer[head, 0], buffer[head, 1], buffer[head, 2]
+    ax, ay, az = buffer[head, 3], buffer[head, 4], buffer[head, 5]
+    buffer[head, 6] = np.sqrt(gx * gx + gy * gy + gz * gz)
+    buffer[head, 7] = np.sqrt(ax * ax + ay * ay + az * az)
+
+@njit(cache=True)
+def window_activity(moments, n):
+    """Media de las desviaciones estándar (ddof=1) por canal a partir de los momentos."""
+    total = 0.0
+    for k in range(moments.shape[1]):
+        var = (moments[1, k] - moments[0, k] * moments[0, k] / n) / (n - 1)
+        total += np.sqrt(max(var, 0.0))
+    return total / moments.shape[1]
+
+def compute_envelope(template, r=DTW_BAND):
+    """Envolventes superior/inferior de la plantilla (radio r) para LB_Keogh."""
+    padded = np.pad(template, ((r, r), (0, 0)), mode='edge')
+    windows = sliding_window_view(padded, 2 * r + 1, axis=0)
+    return windows.max(axis=-1), windows.min(axis=-1)
+
+def lb_keogh(seq, upper, lower):
+    """Cota inferior de la distancia DTW en O(n): si ya supera el umbral, no hace falta el DTW.
+
+    Acepta una envolvente (L x F) o un arreglo apilado (T x L x F); en ese caso devuelve T cotas.
+    """
+    if seq.shape != upper.shape[-2:]:
+        return np.zeros(upper.shape[:-2])
+    dev = np.maximum(seq - upper, 0.0) + np.maximum(lower - seq, 0.0)
+    return np.sqrt((dev * dev).sum(axis=-1)).sum(axis=-1)
+
+@njit(cache=True, fastmath=True)
+def _extract_feats(arr, out):
+    """Copia los 6 canales y añade ambas magnitudes en una sola pasada."""
+    n = arr.shape[0]
+    for i in range(n):
+        gx, gy, gz = arr[i, 0], arr[i, 1], arr[i, 2]
+        ax, ay, az = arr[i, 3], arr[i, 4], arr[i, 5]
+        for k in range(6):
+            out[i, k] = arr[i, k]
+        out[i, 6] = np.sqrt(gx * gx + gy * gy + gz * gz)
+        out[i, 7] = np.sqrt(ax * ax + ay * ay + az * az)
+    return out
+
+def extract_temporal_features(data, out=None):
+    """Calcula magnitudes y combina con datos crudos (arreglo N x 6).
+
+    Con `out` (N x 8, float32) el resultado se escribe ahí en lugar de en un arreglo nuevo.
+    """
+    arr = np.ascontiguousarray(data, dtype=np.float32)
+    if out is None:
+        out = np.empty((arr.shape[0], 8), dtype=np.float32)
+    if NUMBA_AVAILABLE:
+        return _extract_feats(arr, out)
+    # Sin Numba: se escribe directo en la salida, sin temporales de column_stack
+    out[:, :6] = arr
+    gyro, acc = arr[:, :3], arr[:, 3:6]
+    np.sqrt(np.einsum('ij,ij->i', gyro, gyro), out=out[:, 6])
+    np.sqrt(np.einsum('ij,ij->i', acc, acc), out=out[:, 7])
+    return out
+
+# Compilación anticipada: el primer gesto no paga el costo del JIT
+if NUMBA_AVAILABLE:
+    _dtw_nb(np.zeros((2, 8), np.float32), np.zeros((2, 8), np.float32), DTW_BAND, np.inf)
+    _dtw_fixed(np.zeros(FIXED_SHAPE, np.float32), np.zeros(FIXED_SHAPE, np.float32), np.inf)
+    dtw_batch(np.zeros((2, 8), np.float32), np.zeros((1, 2, 8), np.float32), np.full(1, DTW_BAND))
+    _extract_feats(np.zeros((2, NUM_SENSOR_VALUES), np.float32), np.empty((2, 8), np.float32))
+    push_sample(np.zeros((2, NUM_SENSOR_VALUES + 2), np.float32), np.zeros((2, NUM_SENSOR_VALUES)), 0, 1, np.zeros(NUM_SENSOR_VALUES))
+    window_activity(np.zeros((2, NUM_SENSOR_VALUES)), 2)
 
 def clean_and_validate_csv(df):
     """Limpia filas corruptas o con valores extremos del CSV."""
     original_len = len(df)
-    for col in SENSOR_COLS:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+    # read_csv ya deja en float las columnas limpias; solo las que traen basura
+    # (dtype object) necesitan pasar por to_numeric
+    dirty = [col for col in SENSOR_COLS if col in df.columns and df[col].dtype.kind not in 'fiu']
+    if dirty:
+        import pandas as pd
+        df[dirty] = df[dirty].apply(pd.to_numeric, errors='coerce')
     
-    df_clean = df.dropna(subset=SENSOR_COLS)
-    
-    # Filtro de valores extremos (ruido eléctrico)
-    for col in SENSOR_COLS:
-        if 'Gyro' in col:
-            df_clean = df_clean[(df_clean[col] >= -3000) & (df_clean[col] <= 3000)]
-        else: 
-            df_clean = df_clean[(df_clean[col] >= -200) & (df_clean[col] <= 200)]
+    # Filtro de valores extremos (ruido eléctrico) en una sola máscara;
+    # los NaN fallan la comparación y también se descartan
+    arr = df[SENSOR_COLS].to_numpy(dtype=np.float64)
+    gyro_ok = (np.abs(arr[:, :3]) <= 3000).all(axis=1)
+    acc_ok = (np.abs(arr[:, 3:]) <= 200).all(axis=1)
+    df_clean = df.loc[gyro_ok & acc_ok]
     
     if len(df_clean) < original_len:
         print(f"⚠️  Limpieza: Se eliminaron {original_len - len(df_clean)} filas corruptas.")
@@ -91,18 +370,46 @@ def clean_and_validate_csv(df):
 
 # --- GESTIÓN DE ARCHIVOS Y MODELOS ---
 
-def get_gesture_path(gesture_name):
-    return os.path.join(MODELS_DIR, f"{gesture_name}.pkl")
+def get_gesture_path(gesture_name, ext='.pkl'):
+    return os.path.join(MODELS_DIR, f"{gesture_name}{ext}")
 
 def list_trained_gestures():
     if not os.path.exists(MODELS_DIR):
         return []
-    return [f.replace('.pkl', '') for f in os.listdir(MODELS_DIR) if f.endswith('.pkl')]
+    names = [os.path.splitext(f)[0] for f in os.listdir(MODELS_DIR) if f.endswith(('.json', '.pkl'))]
+    return list(dict.fromkeys(names))
+
+def save_gesture(data):
+    """Guarda las plantillas en .npy (mapeable en memoria) y los metadatos en .json."""
+    name = data['gesture_name']
+    np.save(get_gesture_path(name, '.npy'), np.stack(data['templates']).astype(np.float32))
+    meta = {k: v for k, v in data.items() if k != 'templates'}
+    with open(get_gesture_path(name, '.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    # Un .pkl antiguo con el mismo nombre quedaría obsoleto
+    if os.path.exists(get_gesture_path(name)):
+        os.remove(get_gesture_path(name))
 
 def load_gesture(gesture_name):
-    path = get_gesture_path(gesture_name)
-    if not os.path.exists(path): return None
-    return joblib.load(path)
+    meta_path = get_gesture_path(gesture_name, '.json')
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            data = json.load(f)
+        # mmap: varios detectores comparten las mismas páginas y la carga no depende del tamaño
+        data['templates'] = list(np.load(get_gesture_path(gesture_name, '.npy'), mmap_mode='r'))
+    else:
+        # Formato anterior (.pkl de joblib): sin mmap, porque sus plantillas float64 se
+        # copian de todos modos al float32 contiguo que esperan los kernels de DTW
+        path = get_gesture_path(gesture_name)
+        if not os.path.exists(path): return None
+        import joblib
+        data = joblib.load(path)
+        data['templates'] = [np.ascontiguousarray(t, dtype=np.float32) for t in data['templates']]
+    # Las envolventes de LB_Keogh no se guardan: se calculan al cargar
+    if 'envelopes' not in data:
+        band = data.get('dtw_band', DTW_BAND)
+        data['envelopes'] = [compute_envelope(t, band) for t in data['templates']]
+    return data
 
 def load_all_gestures():
     gestures = {}
@@ -110,10 +417,48 @@ def load_all_gestures():
         gestures[name] = load_gesture(name)
     return gestures
 
+def build_template_bank(gestures):
+    """Apila plantillas y envolventes de todos los gestos en arreglos contiguos (una fila por plantilla).
+
+    Lanza ValueError si alguna plantilla no comparte la forma (L x 8) de las demás o si
+    no cabe en la ventana de detección.
+    """
+    names = list(gestures.keys())
+    gesture_of, templates, uppers, lowers, bands = [], [], [], [], []
+    shape = None
+    for idx, name in enumerate(names):
+        model = gestures[name]
+        for temp, (upper, lower) in zip(model['templates'], model['envelopes']):
+            if shape is None:
+                shape = temp.shape
+                if len(shape) != 2 or shape[1] != NUM_SENSOR_VALUES + 2:
+                    raise ValueError(f"Plantilla de '{name}' con forma {temp.shape}: se esperaban {NUM_SENSOR_VALUES + 2} columnas")
+                if shape[0] > DETECTION_WINDOW:
+                    raise ValueError(f"Plantilla de '{name}' más larga ({shape[0]}) que la ventana de detección ({DETECTION_WINDOW})")
+            elif temp.shape != shape:
+                raise ValueError(f"Plantilla de '{name}' con forma {temp.shape}, distinta de {shape}: reentrena los gestos con la misma longitud")
+            gesture_of.append(idx)
+            templates.append(temp)
+            uppers.append(upper)
+            lowers.append(lower)
+            bands.append(model.get('dtw_band', DTW_BAND))
+    if not templates:
+        raise ValueError("Ningún gesto cargado tiene plantillas")
+    return {
+        'names': names,
+        'gesture_of': np.array(gesture_of, dtype=np.int64),
+        'templates': np.ascontiguousarray(np.stack(templates), dtype=np.float32),
+        'upper': np.ascontiguousarray(np.stack(uppers), dtype=np.float32),
+        'lower': np.ascontiguousarray(np.stack(lowers), dtype=np.float32),
+        'bands': np.array(bands, dtype=np.int64)
+    }
+
 def delete_gesture(gesture_name):
-    path = get_gesture_path(gesture_name)
-    if os.path.exists(path):
-        os.remove(path)
+    paths = [get_gesture_path(gesture_name, ext) for ext in ('.json', '.npy', '.pkl')]
+    paths = [p for p in paths if os.path.exists(p)]
+    if paths:
+        for path in paths:
+            os.remove(path)
         print(f"✅ Gesto '{gesture_name}' eliminado.")
     else:
         print(f"❌ Gesto '{gesture_name}' no encontrado.")
@@ -124,6 +469,7 @@ def train_model(csv_file, gesture_name=None):
     if gesture_name is None:
         gesture_name = os.path.splitext(os.path.basename(csv_file))[0]
     
+    import pandas as pd
     try:
         df = pd.read_csv(csv_file)
         print(f"✅ CSV cargado: {len(df)} filas.")
@@ -137,39 +483,36 @@ def train_model(csv_file, gesture_name=None):
         print(f"❌ Error: Insuficientes datos ({len(df)}). Mínimo requerido: {TEMPLATE_LENGTH}")
         return
 
-    # Buscar el segmento con mayor actividad
-    df['Activity'] = df[SENSOR_COLS].std(axis=1)
-    best_start = 0
-    max_activity = 0
-    
-    for i in range(len(df) - TEMPLATE_LENGTH):
-        window = df.iloc[i:i+TEMPLATE_LENGTH]
-        avg_act = window['Activity'].mean()
-        if avg_act > max_activity:
-            max_activity = avg_act
-            best_start = i
+    # Buscar el segmento con mayor actividad (media móvil por suma acumulada, O(N))
+    arr = df[SENSOR_COLS].to_numpy(dtype=np.float64)
+    activity = arr.std(axis=1, ddof=1)
+    cs = np.concatenate(([0.0], np.cumsum(activity)))
+    window_sums = cs[TEMPLATE_LENGTH:] - cs[:-TEMPLATE_LENGTH]
+    best_start = int(np.argmax(window_sums))
+    max_activity = float(window_sums[best_start] / TEMPLATE_LENGTH)
     
     # Extraer y procesar
-    segment = df.iloc[best_start:best_start+TEMPLATE_LENGTH]
-    features = extract_temporal_features(segment[SENSOR_COLS])
-    template_norm = normalize_sequence(features)
+    segment = arr[best_start:best_start+TEMPLATE_LENGTH]
+    features = extract_temporal_features(segment)
+    template_norm = np.ascontiguousarray(normalize_sequence(features), dtype=np.float32)
     
     # Guardar
     data = {
         'gesture_name': gesture_name,
         'templates': [template_norm], # Lista para soportar múltiples variaciones a futuro
         'template_length': TEMPLATE_LENGTH,
+        'dtw_band': DTW_BAND,
         'avg_activity': max_activity,
         'trained_date': time.strftime("%Y-%m-%d %H:%M:%S")
     }
     
-    joblib.dump(data, get_gesture_path(gesture_name))
+    save_gesture(data)
     print(f"🎉 Modelo guardado: {gesture_name.upper()} (Actividad: {max_activity:.2f})")
 
 # --- FASE 2: DETECCIÓN EN TIEMPO REAL (HYBRID: CLI + WEB) ---
 
 def run_detector(serial_port, baud_rate, target_gestures=None, message_callback=None, data_callback=None):
-    global realtime_buffer, cooldown_counter
+    global buffer_count, cooldown_counter
     
     # Sistema de Logs Híbrido (Consola + Web)
     def emit_log(text, type="info", data=None):
@@ -193,7 +536,20 @@ def run_detector(serial_port, baud_rate, target_gestures=None, message_callback=
         emit_log("No hay modelos cargados. Usa 'train' primero.", "error")
         return
 
-    template_len = list(gestures.values())[0]['template_length']
+    # Todas las plantillas apiladas en un solo arreglo para el DTW por lotes. Se valida aquí:
+    # dentro del bucle un ValueError se confundiría con una línea serial corrupta
+    try:
+        bank = build_template_bank(gestures)
+    except ValueError as e:
+        emit_log(f"Modelos incompatibles: {e}", "error")
+        return
+    template_len = bank['templates'].shape[1]
+    
+    # La ventana (y sus momentos) empieza vacía en cada ejecución
+    buffer_count = 0
+    window_moments[:] = 0.0
+    # Destino reutilizable de la ventana normalizada: sin reservas de memoria por evaluación
+    norm_buf = np.empty((template_len, realtime_buffer.shape[1]), dtype=np.float32)
     
     try:
         ser = serial.Serial(serial_port, baud_rate, timeout=1)
@@ -205,17 +561,27 @@ def run_detector(serial_port, baud_rate, target_gestures=None, message_callback=
         return
 
     evaluation_ctr = 0
+    pending = b''  # Bytes recibidos que aún no forman una línea completa
     
     try:
         while True:
-            if ser.in_waiting:
+            # Una sola lectura para todo lo disponible (readline() de pyserial pide los bytes
+            # de uno en uno). Si no hay nada, bloquea hasta el primer byte o el timeout en vez
+            # de sondear con sleep. Lo que no llega a línea completa espera a la siguiente.
+            pending += ser.read(ser.in_waiting or 1)
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
                 try:
-                    line = ser.readline().decode('latin-1').strip()
-                    parts = line.split(',')
-                    
-                    if len(parts) == NUM_SENSOR_VALUES:
-                        vals = [float(p) for p in parts]
-                        
+                    # Exactamente 6 campos, como exigía split(','): fromstring acepta una coma
+                    # final y, en NumPy < 2, devuelve lo leído hasta el error con solo un aviso
+                    if line.count(b',') != NUM_SENSOR_VALUES - 1: continue
+                    # Parseo en C directamente sobre los bytes, sin decodificar a str
+                    # (ValueError o menos de 6 valores si un campo viene corrupto)
+                    vals = np.fromstring(line, sep=',')
+                
+                    # fromstring acepta 'nan'/'inf': una muestra así envenenaría los momentos
+                    # de la ventana para siempre, así que se descarta antes de entrar al buffer
+                    if vals.size == NUM_SENSOR_VALUES and np.isfinite(vals).all():
                         # --- ENVIAR DATOS CRUDOS A LA WEB (DIBUJO) ---
                         if data_callback:
                             data_packet = {
@@ -225,51 +591,62 @@ def run_detector(serial_port, baud_rate, target_gestures=None, message_callback=
                             data_callback(data_packet)
                         # ---------------------------------------------
 
-                        realtime_buffer.append(vals)
-                        if len(realtime_buffer) > DETECTION_WINDOW: 
-                            realtime_buffer.pop(0)
-                        
+                        push_sample(realtime_buffer, window_moments, buffer_count, template_len, vals)
+                        buffer_count += 1
+                    
                         if cooldown_counter > 0:
                             cooldown_counter -= 1
                             continue
-                            
+                        
                         evaluation_ctr += 1
                         # Evaluar solo si tenemos datos suficientes y toca turno
-                        if evaluation_ctr >= STEP_SIZE and len(realtime_buffer) >= template_len:
+                        if evaluation_ctr >= STEP_SIZE and buffer_count >= template_len:
                             evaluation_ctr = 0
-                            
-                            # Análisis de Actividad (ahorra CPU si está quieto)
-                            recent = pd.DataFrame(realtime_buffer[-template_len:], columns=SENSOR_COLS)
-                            if recent.std().mean() < MIN_ACTIVITY: continue
-                            
-                            # Procesamiento
-                            feats = extract_temporal_features(realtime_buffer[-template_len:])
-                            curr_seq = normalize_sequence(feats)
-                            
+                        
+                            # Análisis de Actividad (ahorra CPU si está quieto): O(1) con los momentos
+                            if window_activity(window_moments, template_len) < MIN_ACTIVITY: continue
+                        
+                            # Procesamiento: las características ya están en el buffer
+                            feats = ring_window(realtime_buffer, buffer_count, template_len)
+                            curr_seq = normalize_sequence(feats, out=norm_buf)
+                        
+                            # Cota LB_Keogh: descarta plantillas que no pueden pasar el umbral
+                            lbs = lb_keogh(curr_seq, bank['upper'], bank['lower'])
+                            survivors = np.flatnonzero(lbs <= DTW_THRESHOLD)
+                            survivors = survivors[np.argsort(lbs[survivors])]
+                        
                             # Comparación DTW
                             best_name = None
                             min_dist = float('inf')
+                        
+                            if len(survivors):
+                                # La plantilla con menor cota fija la mejor distancia conocida...
+                                first = survivors[0]
+                                min_dist = dtw_distance(curr_seq, bank['templates'][first], bank['bands'][first], DTW_THRESHOLD)
+                                best_idx = first
+                                bsf = min(min_dist, DTW_THRESHOLD)
                             
-                            for name, model in gestures.items():
-                                for temp in model['templates']:
-                                    d = dtw_distance(curr_seq, temp)
-                                    if d < min_dist:
-                                        min_dist = d
-                                        best_name = name
-                            
+                                # ...y el resto (en paralelo) abandona en cuanto no puede superarla
+                                rest = survivors[1:][lbs[survivors[1:]] <= bsf]
+                                if len(rest):
+                                    dists = dtw_batch(curr_seq, bank['templates'][rest], bank['bands'][rest], bsf)
+                                    k = int(np.argmin(dists))
+                                    if dists[k] < min_dist:
+                                        min_dist = dists[k]
+                                        best_idx = rest[k]
+                                best_name = bank['names'][bank['gesture_of'][best_idx]]
+                        
                             # Validación de Umbral
                             if min_dist <= DTW_THRESHOLD:
                                 # Calcular confianza (100% = distancia 0)
                                 confidence = max(0, 100 - (min_dist / DTW_THRESHOLD * 100))
-                                
+                            
                                 emit_log(best_name, "gesture", {"name": best_name, "score": confidence})
                                 cooldown_counter = COOLDOWN_SAMPLES
-                                realtime_buffer = []
+                                buffer_count = 0
+                                window_moments[:] = 0.0
 
                 except ValueError: pass
-            
-            # Pequeño sleep para no saturar CPU, pero bajo para fluidez del dibujo
-            time.sleep(0.002)
 
     except KeyboardInterrupt:
         emit_log("Detector detenido.", "system")
@@ -289,26 +666,37 @@ def collect_data(output_file, repetitions, serial_port, baud_rate):
         print(f"❌ Error: {e}")
         return
 
-    with open(output_file, 'w') as f:
-        f.write(HEADER)
+    # Archivo binario con buffer grande: las líneas se copian tal cual llegan, sin decodificar,
+    # y el disco se toca cada 64 KB en lugar de una vez por muestra
+    with open(output_file, 'wb', buffering=1 << 16) as f:
+        f.write(HEADER.encode('ascii'))
         print(f"\n📝 Grabando {repetitions} repeticiones en '{output_file}'")
+        pending = b''  # Bytes recibidos que aún no forman una línea completa
         
         for i in range(repetitions):
             input(f"Repetición {i+1}/{repetitions} - Presiona ENTER para empezar...")
             print("🔴 GRABANDO... (Ctrl+C para parar esta toma)")
             
             samples = 0
+            shown = -1  # Último valor impreso del contador
             try:
                 while True:
-                    if ser.in_waiting:
-                        line = ser.readline().decode('latin-1').strip()
-                        if line.count(',') == 5: # Validación básica CSV
-                            f.write(line + '\n')
+                    # Bloquea hasta el primer byte (o el timeout) en lugar de sondear con sleep
+                    pending += ser.read(ser.in_waiting or 1)
+                    *lines, pending = pending.split(b'\n')
+                    for line in lines:
+                        line = line.strip()
+                        if line.count(b',') == 5: # Validación básica CSV
+                            f.write(line + b'\n')
                             samples += 1
-                            sys.stdout.write(f"\rMuestras: {samples}")
-                            sys.stdout.flush()
-                    time.sleep(0.01)
+                    # La terminal solo se toca cuando el contador cambia (no en lecturas
+                    # parciales ni en timeouts)
+                    if samples != shown:
+                        sys.stdout.write(f"\rMuestras: {samples}")
+                        sys.stdout.flush()
+                        shown = samples
             except KeyboardInterrupt:
+                f.flush()  # La toma queda en disco aunque se corte la siguiente
                 print(f"\n✅ Repetición {i+1} guardada.")
                 pass
                 
@@ -324,6 +712,7 @@ def visualize_template(gesture_name=None):
             print(f"\n📊 GESTO: {data['gesture_name']}")
             print(f"   Fecha: {data['trained_date']}")
             print(f"   Samples: {data['template_length']}")
+            print(f"   Banda DTW: {data.get('dtw_band', DTW_BAND)}")
         else:
             print("❌ No encontrado.")
     else:
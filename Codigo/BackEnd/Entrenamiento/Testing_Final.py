@@ -4,18 +4,13 @@ Sistema Integrado de Detección de Gestos con Feedback Visual y Auditivo
 Combina el detector de gestos con control de OLED y Buzzer
 """
 
-import pandas as pd
 import numpy as np
-import joblib
 import serial
 import time
 import sys
 import os
-import json
 import threading
 import RPi.GPIO as GPIO
-from scipy.spatial.distance import euclidean
-from sklearn.preprocessing import StandardScaler
 from PIL import Image
 import cv2
 import random
@@ -25,27 +20,20 @@ from luma.core.interface.serial import i2c
 from luma.core.render import canvas
 from luma.oled.device import ssd1306
 
+# Procesamiento de gestos, carga de modelos y parámetros de detección compartidos
+# con el detector principal (una sola fuente de verdad para umbrales y rutas)
+from Entrenamiento import (build_template_bank, dtw_batch, lb_keogh, load_all_gestures,
+                           normalize_sequence, push_sample, ring_window, window_activity,
+                           BASE_DIR, MODELS_DIR, NUM_SENSOR_VALUES, DETECTION_WINDOW,
+                           STEP_SIZE, DTW_THRESHOLD, MIN_ACTIVITY, COOLDOWN_SAMPLES)
+
 
 # =======================================================
 # CONFIGURACIÓN GLOBAL DEL SISTEMA
 # =======================================================
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODELS_DIR = os.path.join(BASE_DIR, 'gesture_models')
 CARAS_DIR = os.path.join(BASE_DIR, 'Caras')
 
-# Configuración del Sensor
-SENSOR_COLS = ['Gyro_X', 'Gyro_Y', 'Gyro_Z', 'Acc_X', 'Acc_Y', 'Acc_Z']
-NUM_SENSOR_VALUES = 6
-
-# Parámetros de Detección
-TEMPLATE_LENGTH = 80
-DETECTION_WINDOW = 100
-STEP_SIZE = 5
-DTW_THRESHOLD = 190.0
-MIN_ACTIVITY = 0.08
-COOLDOWN_SAMPLES = 40
-
 # Configuración OLED
 OLED_ADDRESS = 0x3C
 OLED_WIDTH = 128
@@ -58,9 +46,13 @@ MAX_IDLE_TIME = 10.0
 # Configuración Buzzer
 BUZZER_PIN = 17
 
-# Buffer global para detección en tiempo real
-realtime_buffer = []
+# Buffer circular preasignado para detección en tiempo real, con las 8 características
+# por muestra (igual que en Entrenamiento.run_detector)
+realtime_buffer = np.empty((DETECTION_WINDOW, NUM_SENSOR_VALUES + 2), dtype=np.float32)
+buffer_count = 0  # Total de muestras escritas (posición = buffer_count % DETECTION_WINDOW)
 cooldown_counter = 0
+# Suma y suma de cuadrados por canal de la ventana: actividad en O(1) por evaluación
+window_moments = np.zeros((2, NUM_SENSOR_VALUES))
 
 
 # =======================================================
@@ -119,57 +111,6 @@ GESTURE_ACTIONS = {
 }
 
 
-# =======================================================
-# FUNCIONES DE PROCESAMIENTO DE GESTOS
-# =======================================================
-
-def normalize_sequence(sequence):
-    scaler = StandardScaler()
-    return scaler.fit_transform(sequence)
-
-def dtw_distance(seq1, seq2):
-    n, m = len(seq1), len(seq2)
-    dtw_matrix = np.full((n + 1, m + 1), np.inf)
-    dtw_matrix[0, 0] = 0
-    
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            cost = euclidean(seq1[i-1], seq2[j-1])
-            dtw_matrix[i, j] = cost + min(
-                dtw_matrix[i-1, j],
-                dtw_matrix[i, j-1],
-                dtw_matrix[i-1, j-1]
-            )
-    return dtw_matrix[n, m]
-
-def extract_temporal_features(data):
-    data_df = pd.DataFrame(data, columns=SENSOR_COLS)
-    gyro_mag = np.sqrt(data_df['Gyro_X']**2 + data_df['Gyro_Y']**2 + data_df['Gyro_Z']**2)
-    acc_mag = np.sqrt(data_df['Acc_X']**2 + data_df['Acc_Y']**2 + data_df['Acc_Z']**2)
-    temporal_features = np.column_stack([
-        data_df[SENSOR_COLS].values,
-        gyro_mag.values.reshape(-1, 1),
-        acc_mag.values.reshape(-1, 1)
-    ])
-    return temporal_features
-
-def load_gesture(gesture_name):
-    path = os.path.join(MODELS_DIR, f"{gesture_name}.pkl")
-    if not os.path.exists(path):
-        return None
-    return joblib.load(path)
-
-def load_all_gestures():
-    gestures = {}
-    if not os.path.exists(MODELS_DIR):
-        return gestures
-    for f in os.listdir(MODELS_DIR):
-        if f.endswith('.pkl'):
-            name = f.replace('.pkl', '')
-            gestures[name] = load_gesture(name)
-    return gestures
-
-
 # =======================================================
 # CLASE: BUZZER CONTROLLER
 # =======================================================
@@ -519,7 +460,7 @@ def apagar_sistema():
 # =======================================================
 
 def run_integrated_detector(serial_port, baud_rate, oled, buzzer):
-    global realtime_buffer, cooldown_counter
+    global buffer_count, cooldown_counter
     
     gestures = load_all_gestures()
     
@@ -527,7 +468,17 @@ def run_integrated_detector(serial_port, baud_rate, oled, buzzer):
         print("❌ No hay modelos entrenados. Usa el modo de entrenamiento primero.")
         return
     
-    template_len = list(gestures.values())[0]['template_length']
+    # Plantillas apiladas una sola vez en float32 contiguo para compararlas todas en paralelo
+    try:
+        bank = build_template_bank(gestures)
+    except ValueError as e:
+        print(f"❌ Modelos incompatibles: {e}")
+        return
+    template_len = bank['templates'].shape[1]
+    # La ventana (y sus momentos) empieza vacía; destino reutilizable de la ventana normalizada
+    buffer_count = 0
+    window_moments[:] = 0.0
+    norm_buf = np.empty((template_len, realtime_buffer.shape[1]), dtype=np.float32)
     
     try:
         ser = serial.Serial(serial_port, baud_rate, timeout=1)
@@ -540,45 +491,53 @@ def run_integrated_detector(serial_port, baud_rate, oled, buzzer):
         return
     
     evaluation_ctr = 0
+    pending = b''  # Bytes recibidos que aún no forman una línea completa
     
     try:
         while True:
-            if ser.in_waiting:
+            # Lectura bloqueante de todo lo disponible (o hasta el timeout) en vez de
+            # sondear in_waiting con sleep; las líneas incompletas esperan a la siguiente
+            pending += ser.read(ser.in_waiting or 1)
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
                 try:
-                    line = ser.readline().decode('latin-1').strip()
-                    parts = line.split(',')
+                    # Exactamente 6 campos (fromstring aceptaría una coma final)
+                    if line.count(b',') != NUM_SENSOR_VALUES - 1:
+                        continue
+                    # Parseo en C de la línea en bytes (ValueError o menos valores si viene corrupta)
+                    vals = np.fromstring(line, sep=',')
                     
-                    if len(parts) == NUM_SENSOR_VALUES:
-                        vals = [float(p) for p in parts]
-                        
-                        realtime_buffer.append(vals)
-                        if len(realtime_buffer) > DETECTION_WINDOW:
-                            realtime_buffer.pop(0)
+                    # 'nan'/'inf' también se parsean: se descartan para no envenenar los momentos
+                    if vals.size == NUM_SENSOR_VALUES and np.isfinite(vals).all():
+                        push_sample(realtime_buffer, window_moments, buffer_count, template_len, vals)
+                        buffer_count += 1
                         
                         if cooldown_counter > 0:
                             cooldown_counter -= 1
                             continue
                         
                         evaluation_ctr += 1
-                        if evaluation_ctr >= STEP_SIZE and len(realtime_buffer) >= template_len:
+                        if evaluation_ctr >= STEP_SIZE and buffer_count >= template_len:
                             evaluation_ctr = 0
                             
-                            recent = pd.DataFrame(realtime_buffer[-template_len:], columns=SENSOR_COLS)
-                            if recent.std().mean() < MIN_ACTIVITY:
+                            if window_activity(window_moments, template_len) < MIN_ACTIVITY:
                                 continue
                             
-                            feats = extract_temporal_features(realtime_buffer[-template_len:])
-                            curr_seq = normalize_sequence(feats)
+                            # Las características ya están en el buffer
+                            feats = ring_window(realtime_buffer, buffer_count, template_len)
+                            curr_seq = normalize_sequence(feats, out=norm_buf)
                             
-                            best_name = None
-                            min_dist = float('inf')
+                            # Cota LB_Keogh (lineal): descarta sin DTW las plantillas que no pueden pasar el umbral
+                            lbs = lb_keogh(curr_seq, bank['upper'], bank['lower'])
+                            survivors = np.flatnonzero(lbs <= DTW_THRESHOLD)
+                            if not len(survivors):
+                                continue
                             
-                            for name, model in gestures.items():
-                                for temp in model['templates']:
-                                    d = dtw_distance(curr_seq, temp)
-                                    if d < min_dist:
-                                        min_dist = d
-                                        best_name = name
+                            # Las plantillas que no pueden bajar del umbral abandonan (inf)
+                            dists = dtw_batch(curr_seq, bank['templates'][survivors], bank['bands'][survivors], DTW_THRESHOLD)
+                            k = int(np.argmin(dists))
+                            min_dist = dists[k]
+                            best_name = bank['names'][bank['gesture_of'][survivors[k]]]
                             
                             if min_dist <= DTW_THRESHOLD:
                                 confidence = max(0, 100 - (min_dist / DTW_THRESHOLD * 100))
@@ -587,12 +546,11 @@ def run_integrated_detector(serial_port, baud_rate, oled, buzzer):
                                 ejecutar_accion_gesto(best_name, oled, buzzer)
                                 
                                 cooldown_counter = COOLDOWN_SAMPLES
-                                realtime_buffer = []
+                                buffer_count = 0
+                                window_moments[:] = 0.0
                 
                 except ValueError:
                     pass
-            
-            time.sleep(0.002)
     
     except KeyboardInterrupt:
         print("\n🛑 Detector detenido por usuario")
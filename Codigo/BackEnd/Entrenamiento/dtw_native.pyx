@@ -0,0 +1,74 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# distutils: extra_compile_args = -O3 -ffast-math -fno-finite-math-only
+"""
+DTW compilado en C para equipos donde Numba/LLVM es demasiado pesado (Raspberry Pi, etc.)
+Compilar con: python3 -m Cython.Build.Cythonize -i dtw_native.pyx
+
+-ffast-math deja al compilador vectorizar la suma de las columnas (igual que fastmath en Numba).
+-fno-finite-math-only mantiene definidas las comparaciones con INFINITY (centinelas y abandono).
+"""
+
+from libc.math cimport sqrt, INFINITY
+from libc.stdlib cimport malloc, free
+
+
+def dtw(const float[:, ::1] a, const float[:, ::1] b, int w, double best_so_far=INFINITY):
+    """Distancia DTW en la banda |i - j| <= w. Devuelve inf si ya no puede bajar de best_so_far."""
+    cdef Py_ssize_t n = a.shape[0], m = b.shape[0], dims = a.shape[1]
+    cdef Py_ssize_t i, j, k, lo, hi
+    cdef double c, d, row_min, result
+    cdef double *prev
+    cdef double *curr
+    cdef double *tmp
+
+    if w < abs(n - m):
+        w = abs(n - m)  # La banda debe alcanzar la esquina (n, m)
+
+    prev = <double *> malloc((m + 1) * sizeof(double))
+    curr = <double *> malloc((m + 1) * sizeof(double))
+    if prev == NULL or curr == NULL:
+        free(prev)
+        free(curr)
+        raise MemoryError()
+
+    # Las celdas a la derecha de la banda nunca se escriben, así que basta con
+    # inicializar ambas filas una vez y limpiar el borde izquierdo en cada fila
+    for j in range(m + 1):
+        prev[j] = INFINITY
+        curr[j] = INFINITY
+    prev[0] = 0.0
+
+    for i in range(1, n + 1):
+        lo = i - w if i - w > 1 else 1
+        hi = i + w if i + w < m else m
+        curr[lo - 1] = INFINITY
+        row_min = INFINITY
+
+        for j in range(lo, hi + 1):
+            c = 0.0
+            for k in range(dims):
+                d = a[i-1, k] - b[j-1, k]
+                c += d * d
+            d = prev[j-1]
+            if prev[j] < d:
+                d = prev[j]
+            if curr[j-1] < d:
+                d = curr[j-1]
+            curr[j] = sqrt(c) + d
+            if curr[j] < row_min:
+                row_min = curr[j]
+
+        # Abandono temprano: ningún camino de esta fila puede mejorar el mejor resultado
+        if row_min > best_so_far:
+            free(prev)
+            free(curr)
+            return INFINITY
+
+        tmp = prev
+        prev = curr
+        curr = tmp
+
+    result = prev[m]
+    free(prev)
+    free(curr)
+    return result
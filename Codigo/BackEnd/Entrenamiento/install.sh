@@ -20,9 +20,16 @@ pip install --user \
     numpy \
     joblib \
     scikit-learn \
+    numba \
+    cython \
     pyserial
 
-echo "--- 4. Instalación finalizada ---"
+# Extensión C opcional del DTW (útil si Numba no está disponible en la placa)
+echo "--- 4. Compilando extensión DTW nativa ---"
+(cd "$(dirname "$0")" && python3 -m Cython.Build.Cythonize -i dtw_native.pyx) \
+    || echo "No se pudo compilar dtw_native; se usará Numba/NumPy."
+
+echo "--- 5. Instalación finalizada ---"
 echo "Las librerías de Python se han instalado en el directorio de usuario (pip install --user)."
 echo "Asegúrate de que el usuario 'pi' pertenece al grupo 'dialout' para usar el puerto serie:"
 echo "sudo usermod -a -G dialout pi"
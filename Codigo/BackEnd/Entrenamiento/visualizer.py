@@ -71,18 +71,17 @@ def update(frame):
     
     try:
         if ser.in_waiting > 0:
-            line_data = ser.readline().decode('latin-1').strip()
-            parts = line_data.split(',')
+            raw = ser.readline()
             
-            if len(parts) == NUM_SENSOR_VALUES:
+            # Las líneas de estado del firmware ("MPU6050 Found!", ...) no traen 6 campos:
+            # se ignoran en silencio, igual que antes con split(',')
+            if raw.count(b',') == NUM_SENSOR_VALUES - 1:
                 try:
-                    # Parsear valores del sensor
-                    gyro_x = float(parts[0])
-                    gyro_y = float(parts[1])
-                    gyro_z = float(parts[2])
-                    acc_x = float(parts[3])
-                    acc_y = float(parts[4])
-                    acc_z = float(parts[5])
+                    # Parsear valores del sensor directo de los bytes (sin decode/strip/split)
+                    vals = np.fromstring(raw, sep=',')
+                    if vals.size != NUM_SENSOR_VALUES:
+                        raise ValueError(f"{vals.size} de {NUM_SENSOR_VALUES} valores numéricos")
+                    gyro_x, gyro_y, gyro_z, acc_x, acc_y, acc_z = vals.tolist()
                     
                     # --- ESTRATEGIA MEJORADA DE MAPEO 2D ---
                     # Usar Gyro_X y Gyro_Y directamente como velocidades
@@ -114,14 +113,13 @@ def update(frame):
                     
                     # Actualizar gráficos
                     if len(trajectory_x) > 1:
-                        line.set_data(list(trajectory_x), list(trajectory_y))
+                        # Una sola copia de cada deque por cuadro; la estela es una vista de ella
+                        xs = np.fromiter(trajectory_x, dtype=np.float64, count=len(trajectory_x))
+                        ys = np.fromiter(trajectory_y, dtype=np.float64, count=len(trajectory_y))
+                        line.set_data(xs, ys)
                         
                         # Estela con gradiente (últimos 50 puntos)
-                        trail_len = min(50, len(trajectory_x))
-                        trail.set_data(
-                            list(trajectory_x)[-trail_len:], 
-                            list(trajectory_y)[-trail_len:]
-                        )
+                        trail.set_data(xs[-50:], ys[-50:])
                     
                     current_point.set_data([current_x], [current_y])
                     
@@ -234,6 +232,17 @@ def run_visualizer(serial_port, baud_rate):
             ser.close()
             print("Conexión serial cerrada")
 
+# --- INTEGRACIÓN DE TRAYECTORIAS DESDE CSV ---
+def integrate_trajectory(df):
+    """Integra Gyro_X/Gyro_Y en una trayectoria 2D partiendo de (0, 0)."""
+    # Misma lógica que en tiempo real (CORREGIDA), con una suma acumulada
+    # en lugar de un bucle fila por fila sobre el DataFrame
+    delta_x = -df['Gyro_Y'].to_numpy(dtype=np.float64) * GYRO_SCALE
+    delta_y = df['Gyro_X'].to_numpy(dtype=np.float64) * GYRO_SCALE
+    traj_x = np.concatenate(([0.0], np.cumsum(delta_x)))
+    traj_y = np.concatenate(([0.0], np.cumsum(delta_y)))
+    return traj_x, traj_y
+
 # --- MODO ALTERNATIVO: COMPARAR GESTO GRABADO ---
 def visualize_from_csv(csv_file):
     """
@@ -252,22 +261,7 @@ def visualize_from_csv(csv_file):
         return
     
     # Integrar la trayectoria desde el CSV
-    traj_x = [0.0]
-    traj_y = [0.0]
-    
-    for i in range(len(df)):
-        gyro_x = df.loc[i, 'Gyro_X']
-        gyro_y = df.loc[i, 'Gyro_Y']
-        
-        # Usar la misma lógica que en tiempo real (CORREGIDA)
-        delta_x = -gyro_y * GYRO_SCALE
-        delta_y = gyro_x * GYRO_SCALE
-        
-        new_x = traj_x[-1] + delta_x
-        new_y = traj_y[-1] + delta_y
-        
-        traj_x.append(new_x)
-        traj_y.append(new_y)
+    traj_x, traj_y = integrate_trajectory(df)
     
     # Graficar
     fig, ax = plt.subplots(figsize=(10, 10))
@@ -316,21 +310,7 @@ def compare_gestures(*csv_files):
             df = pd.read_csv(csv_file)
             
             # Integrar trayectoria
-            traj_x = [0.0]
-            traj_y = [0.0]
-            
-            for i in range(len(df)):
-                gyro_x = df.loc[i, 'Gyro_X']
-                gyro_y = df.loc[i, 'Gyro_Y']
-                
-                delta_x = -gyro_y * GYRO_SCALE
-                delta_y = gyro_x * GYRO_SCALE
-                
-                new_x = traj_x[-1] + delta_x
-                new_y = traj_y[-1] + delta_y
-                
-                traj_x.append(new_x)
-                traj_y.append(new_y)
+            traj_x, traj_y = integrate_trajectory(df)
             
             # Graficar
             color = colors[idx % len(colors)]